@@ -1,5 +1,6 @@
 import bmp180
 import time
+import asyncio
 import board
 import busio
 import os
@@ -9,51 +10,96 @@ import socketpool
 import ssl
 import smtp_circuitpython
 import digitalio
+import alarm
 from secrets import secrets
 
 
 
 HIGH_TEMP = 83  # Fahrenheit
-POLL_FREQ = 30   # seconds
-MAIL_DELAY = 600.0  # seconds
+HIGH_TEMP_C = (HIGH_TEMP - 32.0) * 5.0 / 9.0
+POLL_MIN = 10   # seconds, poll interval near or above HIGH_TEMP
+POLL_MAX = 300  # seconds, poll interval when far below HIGH_TEMP
+POLL_SCALE = 27  # seconds of poll interval per degree C (15 per degree F) below HIGH_TEMP
+MAIL_BURST = 3  # alert emails that can be sent back to back
+MAIL_RATE = 1 / 3600.0  # alert emails regained per second (1 per hour)
+MAIL_DELAY = 600.0  # seconds between digest emails during one excursion
+IP_REFRESH = 3600  # seconds between re-reading the DHCP address
 
 i2c = busio.I2C(board.GP17, board.GP16)
 
 bmp = bmp180.BMP180(i2c)
 
-bmp.sea_level_pressure = 1013.25
-#bmp.sea_level_pressure = 1016.8
-
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 465
-
-last_violation = time.monotonic()
+SMTP_KEEPALIVE = 300  # seconds between NOOPs on the open SMTP connection
 
 led = digitalio.DigitalInOut(board.LED)
 led.direction = digitalio.Direction.OUTPUT
 led.value = False
 
-def send_mail(tempF):
+# The SMTP client uses blocking sockets, so the event loop, and with it
+# temperature sampling, is paused until a mail has been sent.
+def send_mail(temps):
     mail_to = secrets['gmail_to']
-    mail_subject="Temp Alert!  Temp in RV is at %0.1f" % tempF
-    mail_body= "Temp Alert\r\n"
-    mail_body += "IP Address is "+str(wifi.radio.ipv4_address)
+    if len(temps) == 1:
+        parts = ["Subject: Temp Alert!  Temp in RV is at %0.1f" % temps[0],
+                 "\r\n\r\nTemp Alert\r\n"]
+    else:
+        parts = ["Subject: Temp Alert!  %d high readings in RV, max %0.1f" % (len(temps), max(temps)),
+                 "\r\n\r\nTemp Alert\r\n",
+                 "Min %0.1f  Max %0.1f  Last %0.1f\r\n" % (min(temps), max(temps), temps[-1])]
+    parts.append("IP Address is ")
+    parts.append(MY_IP)
+
+    global smtp
+    try:
+        if smtp is None:
+            smtp = open_smtp()
+        smtp.to(mail_to)
+    except Exception as e:
+        # The kept-open connection went stale, reconnect and try once more
+        print("SMTP error", e)
+        close_smtp()
+        smtp = open_smtp()
+        smtp.to(mail_to)
+    try:
+        smtp.body("".join(parts))
+    except Exception:
+        close_smtp()
+        raise
+    return None
 
-    smtp = smtp_circuitpython.SMTP(host=SMTP_SERVER, port=SMTP_PORT,
+def open_smtp():
+    return smtp_circuitpython.SMTP(host=SMTP_SERVER, port=SMTP_PORT,
                 pool=pool, ssl_context=ssl_context, use_ssl = True,
                 username=secrets['gmail_user'],password=secrets['gmail_password'],
-                debug = True)
-    smtp.to(mail_to)
-    smtp.body("Subject: "+mail_subject+"\r\n\r\n"+mail_body)
-    smtp.quit()
-    return None
-
-def get_tempF():
-    tempC = bmp.temperature
-    tempF = tempC * (9/5) + 32
-    return tempF
-
-
+                debug = secrets.get('smtp_debug', False))
+
+def close_smtp():
+    global smtp
+    if smtp is not None:
+        try:
+            smtp.close()
+        except Exception:
+            pass
+        smtp = None
+
+next_keepalive = 0.0  # monotonic deadlines of the periodic tasks, see idle()
+next_ip_refresh = 0.0
+
+async def smtp_keepalive():
+    global next_keepalive
+    while True:
+        next_keepalive = time.monotonic() + SMTP_KEEPALIVE
+        await asyncio.sleep(SMTP_KEEPALIVE)
+        if smtp is not None:
+            try:
+                code, resp = smtp.noop()
+                if code != b"250":
+                    close_smtp()
+            except Exception as e:
+                print("SMTP error", e)
+                close_smtp()
 
 try: 
     wifi.radio.connect(secrets['CIRCUITPY_WIFI_SSID'], 
@@ -65,26 +111,96 @@ except Exception as e:
 pool = socketpool.SocketPool(wifi.radio)
 ssl_context = ssl.create_default_context()
 
-print("My IP:", wifi.radio.ipv4_address)
-
-ipv4 = ipaddress.ip_address("8.8.4.4")
-print("Google pinged at: %f ms" % (wifi.radio.ping(ipv4) * 1000))
-
-
-
-
-while True:
-    tempF = get_tempF()
-    #print("\nTemperature: %0.1f C" % bmp.temperature)
-    #print("Pressure: %0.1f hPa" % bmp.pressure)
-    #print("Altitude = %0.2f meters" % bmp.altitude)
-    print(tempF)    
-    now = time.monotonic()
-    
-    if ((tempF > HIGH_TEMP) and (now - last_violation > MAIL_DELAY)):
-        print("Temp is high: %0.1f F. Sending email: " % tempF)
-        last_violation = time.monotonic()
-        send_mail(tempF)
-
-    time.sleep(POLL_FREQ)
-
+MY_IP = str(wifi.radio.ipv4_address)
+print("My IP:", MY_IP)
+
+smtp = None  # opened by the first send_mail, then kept open
+
+first_sample = asyncio.Event()
+
+async def idle(now, seconds):
+    # Light sleep blocks every task, so let the ready ones run first.
+    # Each light sleep ends by the next keepalive or IP refresh so those tasks
+    # run on time.
+    wake_at = now + seconds
+    while True:
+        await asyncio.sleep(0)
+        t = time.monotonic()
+        if t >= wake_at:
+            return
+        alarm_at = min(wake_at, next_keepalive, next_ip_refresh)
+        if alarm_at > t:
+            time_alarm = alarm.time.TimeAlarm(monotonic_time=alarm_at)
+            alarm.light_sleep_until_alarms(time_alarm)
+        else:
+            await asyncio.sleep(0.01)  # a periodic task is due, let it run
+
+async def monitor():
+    tokens = MAIL_BURST
+    last_refill = time.monotonic()
+    pending = []  # high readings not yet reported
+    high = False  # temperature was above HIGH_TEMP at the previous poll
+    last_mail = last_refill
+    while True:
+        bmp.start_temp_measurement()
+        await asyncio.sleep(0.005)  # temperature conversion time
+        tempC = bmp.read_temp_result()
+        #print("\nTemperature: %0.1f C" % bmp.temperature)
+        #print("Pressure: %0.1f hPa" % await bmp.pressure_async())
+        #print("Altitude = %0.2f meters" % bmp.altitude)
+        print("%0.1f C" % tempC)
+        first_sample.set()
+        now = time.monotonic()
+        tokens = min(MAIL_BURST, tokens + (now - last_refill) * MAIL_RATE)
+        last_refill = now
+
+        crossed = False
+        if tempC > HIGH_TEMP_C:
+            pending.append(tempC * 1.8 + 32.0)
+            crossed = not high
+            high = True
+        else:
+            high = False
+
+        # The reading that starts an excursion goes out right away, later ones
+        # are coalesced into a digest at most every MAIL_DELAY
+        if pending and tokens >= 1 and (crossed or now - last_mail >= MAIL_DELAY):
+            print("Temp is high: %0.1f F. Sending email: " % pending[-1])
+            tokens -= 1
+            last_mail = now
+            try:
+                send_mail(pending)
+            except Exception as e:
+                print("Error sending mail", e)
+            pending = []
+
+        # Poll less often the further the temperature is from HIGH_TEMP
+        margin = HIGH_TEMP_C - tempC
+        interval = max(POLL_MIN, min(POLL_MAX, margin * POLL_SCALE))
+        await idle(now, interval)
+
+async def startup_ping():
+    # Let monitor() take its first sample before the blocking ping
+    await first_sample.wait()
+    ipv4 = ipaddress.ip_address("8.8.4.4")
+    try:
+        ping = wifi.radio.ping(ipv4)
+    except Exception as e:
+        print("Error", e)
+        return
+    if ping is None:
+        print("Google ping timed out")
+    else:
+        print("Google pinged at: %f ms" % (ping * 1000))
+
+async def refresh_ip():
+    global MY_IP, next_ip_refresh
+    while True:
+        next_ip_refresh = time.monotonic() + IP_REFRESH
+        await asyncio.sleep(IP_REFRESH)
+        MY_IP = str(wifi.radio.ipv4_address)
+
+async def main():
+    await asyncio.gather(monitor(), startup_ping(), refresh_ip(), smtp_keepalive())
+
+asyncio.run(main())
@@ -12,7 +12,7 @@ CircuitPython driver from BMP180 Temperature and Barometric Pressure sensor
 """
 
 
-from time import sleep
+from time import sleep, monotonic
 from micropython import const
 from i2c_struct import ROUnaryStruct, UnaryStruct, Struct
 from adafruit_bus_device import i2c_device
@@ -22,10 +22,15 @@ try:
 except ImportError:
     pass
 
+try:
+    import asyncio
+except ImportError:
+    pass
+
 __version__ = "0.0.0-auto.0"
 __repo__ = "https://github.com/jposada202020/CircuitPython_BMP180.git"
 
-_CHIP_ID = const(0x255)
+_CHIP_ID = const(0x55)
 _I2C_ADDR = const(0x77)
 
 _REGISTER_CHIPID = const(0xD0)
@@ -41,12 +46,12 @@ PRESSURE_OVERSAMPLING_X2 = const(0x02)
 PRESSURE_OVERSAMPLING_X4 = const(0x03)
 PRESSURE_OVERSAMPLING_X8 = const(0x04)
 
-_BMP180_PRESSURE_CMD = {
-    PRESSURE_OVERSAMPLING_X1: 0x34,
-    PRESSURE_OVERSAMPLING_X2: 0x74,
-    PRESSURE_OVERSAMPLING_X4: 0xB4,
-    PRESSURE_OVERSAMPLING_X8: 0xF4,
-}
+_BMP180_OVERSAMPLINGS = (
+    PRESSURE_OVERSAMPLING_X1,
+    PRESSURE_OVERSAMPLING_X2,
+    PRESSURE_OVERSAMPLING_X4,
+    PRESSURE_OVERSAMPLING_X8,
+)
 
 """mode values"""
 MODE_ULTRALOWPOWER = const(0x00)
@@ -56,6 +61,24 @@ MODE_ULTRAHIGHRES = const(0x03)
 
 _BMP180_MODES = (MODE_ULTRALOWPOWER, MODE_STANDARD, MODE_HIGHRES, MODE_ULTRAHIGHRES)
 
+# Pressure conversion command and conversion time in seconds, indexed by mode
+_BMP180_PRESSURE_CMD = (0x34, 0x74, 0xB4, 0xF4)
+_CONV_TIMES = (0.005, 0.008, 0.014, 0.026)
+
+# Reciprocals of the powers of two used by the compensation formulas, so the
+# hot path multiplies instead of calling pow() and dividing
+_INV_2_2 = 0.25
+_INV_2_4 = 1 / 16.0
+_INV_2_8 = 1 / 256.0
+_INV_2_11 = 1 / 2048.0
+_INV_2_12 = 1 / 4096.0
+_INV_2_13 = 1 / 8192.0
+_INV_2_15 = 1 / 32768.0
+_INV_2_16 = 1 / 65536.0
+
+# B5 (temperature compensation term) and the last sample are reused within this window
+_B5_MAX_AGE = 1.0  # seconds
+
 
 class BMP180:
     """Driver for the BMP180 Sensor connected over I2C.
@@ -91,12 +114,10 @@ class BMP180:
 
     """
 
-    _device_id = ROUnaryStruct(_REGISTER_CHIPID, "H")
+    _device_id = ROUnaryStruct(_REGISTER_CHIPID, "B")
     _reg_control = UnaryStruct(_REGISTER_CONTROL, "H")
     _reg_soft_reset = UnaryStruct(_REGISTER_SOFTRESET, "H")
-    _regdata_MSB = UnaryStruct(_REGISTER_DATA, "H")
-    _regdata_LSB = UnaryStruct(_REGISTER_DATA + 1, "H")
-    _regdata_XLSB = UnaryStruct(_REGISTER_DATA + 2, "H")
+    _raw_pressure = Struct(_REGISTER_DATA, ">BBB")
 
     _coeffs = Struct(_REGISTER_AC1, ">hhhHHHhhhhh")
     _raw_temperature = UnaryStruct(_REGISTER_DATA, ">H")
@@ -109,10 +130,34 @@ class BMP180:
                 "Failed to find BMP180! Chip ID {}".format(self._device_id)
             )
 
-        self._oversampling_setting = PRESSURE_OVERSAMPLING_X8
-        self._mode = MODE_HIGHRES
+        self._oversampling_setting = PRESSURE_OVERSAMPLING_X1
+        self._mode = MODE_ULTRALOWPOWER
         self.coeffs_mem = self._coeffs
+        (
+            self._ac1,
+            self._ac2,
+            self._ac3,
+            self._ac4,
+            self._ac5,
+            self._ac6,
+            self._b1,
+            self._b2,
+            self._mb,
+            self._mc,
+            self._md,
+        ) = (float(coeff) for coeff in self.coeffs_mem)
+        self._mc_2_11 = self._mc * 2048.0
+        self._update_oss_factors()
         self.sea_level_pressure = 1013.25
+        self._b5_cached = None
+        self._b5_expires = 0.0
+        self._sample = None
+        self._sample_expires = 0.0
+
+    def _update_oss_factors(self):
+        """Precompute the mode dependent factors used in the pressure calculation"""
+        self._oss_factor = float(1 << self._mode)
+        self._oss_50000 = 50000 / self._oss_factor
 
     def _reset(self):
         """Soft reset the sensor"""
@@ -125,14 +170,69 @@ class BMP180:
         The compensated temperature in Celsius.
         Calculation of true temperature in steps of 0.1°C.
         """
+        if monotonic() < self._sample_expires:
+            return self._sample[0]
+        B5 = self._read_b5()
+        temp = (B5 + 8) * _INV_2_4 * 0.1
+        return temp
+
+    def sample(self):
+        """
+        Read temperature and pressure in one go and return them as a
+        ``(temperature, pressure)`` tuple in Celsius and hectoPascals.
+        The temperature conversion is shared by both values.
+        """
+        B5 = self._get_b5()
+        UP = self._read_raw_pressure()
+        return self._store_sample(UP, B5)
+
+    def _store_sample(self, UP, B5):
+        """Compensate a raw pressure reading and cache it with its temperature"""
+        self._sample = ((B5 + 8) * _INV_2_4 * 0.1, self._pressure_hpa(UP, B5))
+        # The sample is as fresh as the temperature conversion it was computed with
+        self._sample_expires = self._b5_expires
+        return self._sample
+
+    def start_temp_measurement(self):
+        """Start a temperature conversion. The result is ready after 5ms and can be
+        fetched with :meth:`read_temp_result`, leaving the wait to the caller."""
         self._reg_control = TEMPERATURE_CMD
+
+    def read_temp_result(self):
+        """Read the temperature conversion started by :meth:`start_temp_measurement`
+        and return the compensated temperature in Celsius."""
+        B5 = self._compute_b5()
+        return (B5 + 8) * _INV_2_4 * 0.1
+
+    def _read_b5(self):
+        """Start a temperature conversion and return the B5 compensation term."""
+        self.start_temp_measurement()
         sleep(0.005)  # Wait 5ms
+        return self._compute_b5()
+
+    def _compute_b5(self):
+        """Compute the B5 compensation term from the last temperature conversion.
+        The result is cached so a following pressure read can skip the conversion."""
         UT = self._raw_temperature
-        X1 = ((UT - self.coeffs_mem[5]) * self.coeffs_mem[4]) / 2**15.0
-        X2 = (self.coeffs_mem[9] * 2**11.0) / (X1 + self.coeffs_mem[10])
+        X1 = (UT - self._ac6) * self._ac5 * _INV_2_15
+        X2 = self._mc_2_11 / (X1 + self._md)
         B5 = X1 + X2
-        temp = ((B5 + 8) / 2**4.0) / 10.0
-        return temp
+        self._b5_cached = B5
+        self._b5_expires = monotonic() + _B5_MAX_AGE
+        return B5
+
+    def _fresh_b5(self):
+        """Return the cached B5 term if still fresh, otherwise None"""
+        if monotonic() < self._b5_expires:
+            return self._b5_cached
+        return None
+
+    def _get_b5(self):
+        """Return the cached B5 term if still fresh, otherwise read a new one"""
+        B5 = self._fresh_b5()
+        if B5 is None:
+            B5 = self._read_b5()
+        return B5
 
     @property
     def altitude(self):
@@ -144,7 +244,7 @@ class BMP180:
         can be calculated too. See the altitude setter for this calculation
         """
         altitude = 44330.0 * (
-            1.0 - ((self.pressure / self.sea_level_pressure) ** 0.19025)
+            1.0 - ((self.pressure * self._inv_sea_level_pressure) ** 0.19025)
         )
         return round(altitude, 1)
 
@@ -152,61 +252,83 @@ class BMP180:
     def altitude(self, value: float) -> None:
         self.sea_level_pressure = self.pressure / (1.0 - value / 44330.0) ** 5.255
 
+    @property
+    def sea_level_pressure(self):
+        """Pressure at sea level in hectoPascals, used for the altitude calculation"""
+        return self._sea_level_pressure
+
+    @sea_level_pressure.setter
+    def sea_level_pressure(self, value: float) -> None:
+        self._sea_level_pressure = value
+        self._inv_sea_level_pressure = 1.0 / value
+
     @property
     def pressure(self):
         """
         The compensated pressure in hectoPascals.
         Calculation of true  pressure in steps of 1Pa (= 0.01hPa = 0.01mbar)
         """
-        self._reg_control = TEMPERATURE_CMD
-        sleep(0.005)  # Wait 5ms
-        UT = self._raw_temperature
-        UP = self._read_raw_pressure()
+        if monotonic() < self._sample_expires:
+            return self._sample[1]
+        return self.sample()[1]
 
-        X1 = ((UT - self.coeffs_mem[5]) * self.coeffs_mem[4]) / 2**15.0
-        X2 = (self.coeffs_mem[9] * 2**11.0) / (X1 + self.coeffs_mem[10])
-        B5 = X1 + X2
+    def _pressure_hpa(self, UP, B5):
+        """Compensate a raw pressure reading and return it in hectoPascals"""
         B6 = B5 - 4000
-        X1 = (self.coeffs_mem[7] * (B6 * B6) / 2**12.0) / 2**11.0
-        X2 = (self.coeffs_mem[1] * B6) / 2**11.0
+        B6_2 = B6 * B6 * _INV_2_12
+        X1 = self._b2 * B6_2 * _INV_2_11
+        X2 = self._ac2 * B6 * _INV_2_11
         X3 = X1 + X2
-        B3 = (((self.coeffs_mem[0] * 4 + X3) * 2 ** float(self._mode)) + 2) / 4
-        X1 = (self.coeffs_mem[2] * B6) / 2**13.0
-        X2 = (self.coeffs_mem[6] * ((B6 * B6) / 2**12.0)) / 2**16.0
-        X3 = ((X1 + X2) + 2) / 2**2.0
-        B4 = (self.coeffs_mem[3] * (X3 + 32768.0)) / 2**15.0
-        B7 = (UP - B3) * (50000 / 2 ** float(self._mode))
+        B3 = ((self._ac1 * 4 + X3) * self._oss_factor + 2) * _INV_2_2
+        X1 = self._ac3 * B6 * _INV_2_13
+        X2 = self._b1 * B6_2 * _INV_2_16
+        X3 = ((X1 + X2) + 2) * _INV_2_2
+        B4 = self._ac4 * (X3 + 32768.0) * _INV_2_15
+        B7 = (UP - B3) * self._oss_50000
 
         if B7 < 2147483648.0:
             press = (B7 * 2) / B4
         else:
             press = (B7 / B4) * 2
 
-        X1 = (press / 2**8.0) * (press / 2**8.0)
-        X1 = (X1 * 3038) / 2**16.0
-        X2 = (-7357 * press) / 2**16.0
+        X1 = press * _INV_2_8
+        X1 = X1 * X1
+        X1 = X1 * 3038 * _INV_2_16
+        X2 = -7357 * press * _INV_2_16
 
-        return (press + ((X1 + X2 + 3791) / 2**4.0)) / 100
-
-    def _read_raw_pressure(self):
+        return (press + (X1 + X2 + 3791) * _INV_2_4) * 0.01
 
+    async def pressure_async(self):
+        """
+        The compensated pressure in hectoPascals, awaiting the conversion times
+        with :func:`asyncio.sleep` instead of blocking.
+        """
+        B5 = self._fresh_b5()
+        if B5 is None:
+            self.start_temp_measurement()
+            await asyncio.sleep(0.005)  # Wait 5ms
+            B5 = self._compute_b5()
+        self.start_pressure()
+        await asyncio.sleep(_CONV_TIMES[self._mode])
+        UP = self.finish_pressure()
+        return self._store_sample(UP, B5)[1]
+
+    def start_pressure(self):
+        """Start a pressure conversion for the current mode. The result can be
+        fetched with :meth:`finish_pressure` once the conversion time has elapsed."""
         self._reg_control = _BMP180_PRESSURE_CMD[self._mode]
 
-        if self._mode == PRESSURE_OVERSAMPLING_X8:
-            sleep(0.026)
-        elif self._mode == PRESSURE_OVERSAMPLING_X4:
-            sleep(0.014)
-        elif self._mode == PRESSURE_OVERSAMPLING_X2:
-            sleep(0.008)
-        else:
-            sleep(0.005)
-
-        msb = self._regdata_MSB & 0xFF
-        lsb = self._regdata_LSB & 0xFF
-        xlsb = self._regdata_XLSB & 0xFF
+    def finish_pressure(self):
+        """Read the raw pressure from the conversion started by :meth:`start_pressure`"""
+        msb, lsb, xlsb = self._raw_pressure
 
         return ((msb << 16) + (lsb << 8) + xlsb) >> (8 - self._mode)
 
+    def _read_raw_pressure(self):
+        self.start_pressure()
+        sleep(_CONV_TIMES[self._mode])
+        return self.finish_pressure()
+
     @property
     def mode(self):
         """
@@ -244,6 +366,8 @@ class BMP180:
         if value not in _BMP180_MODES:
             raise ValueError("Mode {} not supported".format(value))
         self._mode = value
+        self._update_oss_factors()
+        self._sample_expires = 0.0  # cached sample used the old oversampling
 
     @property
     def oversampling_setting(self):
@@ -255,6 +379,6 @@ class BMP180:
 
     @oversampling_setting.setter
     def oversampling_setting(self, value):
-        if not value in _BMP180_PRESSURE_CMD:
+        if not value in _BMP180_OVERSAMPLINGS:
             raise ValueError("Overscan value {} not supported".format(value))
         self._oversampling_setting = value
@@ -212,3 +212,11 @@ class SMTP:
         """ Send QUIT command to smtp server and close socket"""
         self.cmd(b"QUIT")
         self._sock.close()
+
+    def noop(self):
+        """ Send NOOP command to smtp server, used to keep the connection open"""
+        return self.cmd(b"NOOP")
+
+    def close(self):
+        """ Close the socket without sending QUIT, for a connection that has failed"""
+        self._sock.close()